@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Distributed under GNU/GPL 2 license
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/
+
+
+"""
+Ceph nagios plugins entry point
+
+Run with python3 -m cephnagios. Imports check_ceph_health from the package,
+so the mypyc compiled extension is used when it has been built.
+"""
+
+import sys
+
+from cephnagios import check_ceph_health
+
+if __name__ == "__main__":
+    sys.exit(check_ceph_health.main())
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+# Distributed under GNU/GPL 2 license
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/
+
+
+"""
+Optional io_uring backend, bound with ctypes to liburing
+
+liburing-ffi exports the inline helpers (io_uring_get_sqe, io_uring_prep_*,
+...) that liburing only declares in its headers.
+"""
+
+import os
+import re
+import ctypes
+import errno
+
+LIBURING = 'liburing-ffi.so.2'
+# IORING_OP_SEND and IORING_OP_STATX were added in linux 5.6
+MIN_KERNEL_VERSION = (5, 6)
+
+AT_FDCWD = -100
+STATX_TYPE = 0x1
+# struct statx is only filled by the kernel, the result code is enough to know if a path exists
+STATX_SIZE = 256
+
+# struct io_uring is only handled by liburing, reserve more than its size
+IO_URING_SIZE = 512
+
+_liburing = None
+
+
+class IoUringCqe(ctypes.Structure):
+    """
+    struct io_uring_cqe
+    """
+    _fields_ = [
+        ('user_data', ctypes.c_uint64),
+        ('res', ctypes.c_int32),
+        ('flags', ctypes.c_uint32),
+    ]
+
+
+def _kernel_version():
+    """
+    Get running kernel version
+    :return: (major, minor) kernel version, (0, 0) if unknown
+    """
+    match = re.match(r'(\d+)\.(\d+)', os.uname().release)
+    if match is None:
+        return 0, 0
+    return int(match.group(1)), int(match.group(2))
+
+
+def _load_liburing():
+    """
+    Load liburing and declare the used functions
+    :return: liburing library
+    """
+    global _liburing
+    if _liburing is None:
+        lib = ctypes.CDLL(LIBURING, use_errno=True)
+        lib.io_uring_queue_init.argtypes = (ctypes.c_uint, ctypes.c_void_p, ctypes.c_uint)
+        lib.io_uring_queue_init.restype = ctypes.c_int
+        lib.io_uring_queue_exit.argtypes = (ctypes.c_void_p,)
+        lib.io_uring_queue_exit.restype = None
+        lib.io_uring_get_sqe.argtypes = (ctypes.c_void_p,)
+        lib.io_uring_get_sqe.restype = ctypes.c_void_p
+        lib.io_uring_prep_send.argtypes = (ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t,
+                                           ctypes.c_int)
+        lib.io_uring_prep_send.restype = None
+        lib.io_uring_prep_statx.argtypes = (ctypes.c_void_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_int,
+                                            ctypes.c_uint, ctypes.c_void_p)
+        lib.io_uring_prep_statx.restype = None
+        lib.io_uring_sqe_set_flags.argtypes = (ctypes.c_void_p, ctypes.c_uint)
+        lib.io_uring_sqe_set_flags.restype = None
+        lib.io_uring_sqe_set_data64.argtypes = (ctypes.c_void_p, ctypes.c_uint64)
+        lib.io_uring_sqe_set_data64.restype = None
+        lib.io_uring_submit_and_wait.argtypes = (ctypes.c_void_p, ctypes.c_uint)
+        lib.io_uring_submit_and_wait.restype = ctypes.c_int
+        lib.io_uring_peek_cqe.argtypes = (ctypes.c_void_p, ctypes.POINTER(ctypes.POINTER(IoUringCqe)))
+        lib.io_uring_peek_cqe.restype = ctypes.c_int
+        lib.io_uring_cqe_seen.argtypes = (ctypes.c_void_p, ctypes.POINTER(IoUringCqe))
+        lib.io_uring_cqe_seen.restype = None
+        _liburing = lib
+    return _liburing
+
+
+def available():
+    """
+    Check if io_uring can be used
+    :return: True if the kernel and liburing support io_uring send and statx operations
+    """
+    if _kernel_version() < MIN_KERNEL_VERSION:
+        return False
+    try:
+        _load_liburing()
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+def _check(ret):
+    """
+    Raise OSError for a negative errno return value
+    :param ret: liburing return value
+    :return: ret
+    """
+    if ret < 0:
+        raise OSError(-ret, os.strerror(-ret))
+    return ret
+
+
+class IoUring:
+    """
+    io_uring instance
+    """
+    def __init__(self, entries):
+        self._lib = _load_liburing()
+        self._ring = ctypes.create_string_buffer(IO_URING_SIZE)
+        _check(self._lib.io_uring_queue_init(entries, self._ring, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Release the io_uring instance
+        """
+        self._lib.io_uring_queue_exit(self._ring)
+
+    def _get_sqe(self):
+        """
+        Get a submission queue entry
+        :return: Submission queue entry
+        """
+        sqe = self._lib.io_uring_get_sqe(self._ring)
+        if not sqe:
+            raise OSError(errno.EBUSY, 'io_uring submission queue is full')
+        return sqe
+
+    def _set_sqe(self, sqe, userdata, flags):
+        """
+        Set flags and user data of a prepared submission queue entry
+        :param sqe: Submission queue entry
+        :param userdata: Value returned in the completion of the entry
+        :param flags: Submission queue entry flags
+        """
+        self._lib.io_uring_sqe_set_flags(sqe, flags)
+        self._lib.io_uring_sqe_set_data64(sqe, userdata)
+
+    def prep_send(self, fd, buf, userdata, flags=0):
+        """
+        Queue a send of the whole buffer
+        :param fd: Socket file descriptor
+        :param buf: ctypes buffer, kept alive until completion
+        :param userdata: Value returned in the completion
+        :param flags: Submission queue entry flags
+        """
+        sqe = self._get_sqe()
+        self._lib.io_uring_prep_send(sqe, fd, buf, len(buf), 0)
+        self._set_sqe(sqe, userdata, flags)
+
+    def prep_statx(self, path, buf, userdata, flags=0):
+        """
+        Queue a statx of a path
+        :param path: Path bytes, kept alive until completion
+        :param buf: ctypes buffer of STATX_SIZE bytes, kept alive until completion
+        :param userdata: Value returned in the completion
+        :param flags: Submission queue entry flags
+        """
+        sqe = self._get_sqe()
+        self._lib.io_uring_prep_statx(sqe, AT_FDCWD, path, 0, STATX_TYPE, buf)
+        self._set_sqe(sqe, userdata, flags)
+
+    def submit_and_wait(self, count):
+        """
+        Submit the queued entries and wait for their completion
+        :param count: Number of completions to wait for
+        :return: Result of each completion, by user data
+        """
+        _check(self._lib.io_uring_submit_and_wait(self._ring, count))
+        results = dict()
+        cqe = ctypes.POINTER(IoUringCqe)()
+        for _ in range(count):
+            _check(self._lib.io_uring_peek_cqe(self._ring, ctypes.byref(cqe)))
+            results[cqe.contents.user_data] = cqe.contents.res
+            self._lib.io_uring_cqe_seen(self._ring, cqe)
+        return results
+
+
+def send_many(requests):
+    """
+    Send every request with a single io_uring_enter
+    :param requests: (socket file descriptor, request bytes) pairs
+    """
+    sendbufs = [ctypes.create_string_buffer(request, len(request)) for _, request in requests]
+    with IoUring(len(requests)) as ring:
+        for index, (fd, _) in enumerate(requests):
+            ring.prep_send(fd, sendbufs[index], index)
+        results = ring.submit_and_wait(len(requests))
+    for index, (_, request) in enumerate(requests):
+        if _check(results[index]) != len(request):
+            raise OSError(errno.EIO, 'Short send on io_uring')
+
+
+def exists_many(paths):
+    """
+    Check if every path exists with a single io_uring_enter
+    :param paths: Paths
+    :return: True for each existing path, False otherwise
+    """
+    encoded = [os.fsencode(path) for path in paths]
+    statxbufs = [ctypes.create_string_buffer(STATX_SIZE) for _ in paths]
+    with IoUring(len(paths)) as ring:
+        for index, path in enumerate(encoded):
+            ring.prep_statx(path, statxbufs[index], index)
+        results = ring.submit_and_wait(len(paths))
+    return [results[index] == 0 for index in range(len(paths))]
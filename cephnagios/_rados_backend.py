@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+# Distributed under GNU/GPL 2 license
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/
+
+
+"""
+Rados bindings backend, shared by the plugin and the helper daemon
+"""
+
+import json
+import math
+
+import rados  # type: ignore
+
+
+def connect_cluster(connectionoptions, timeout):
+    """
+    Connect to the ceph cluster. The handle is shut down if the connection fails.
+    The bindings ignore the timeout of mon_command, the handle gets it in its conf
+    :param connectionoptions: conf, mon address, client id, client name and keyring
+    :param timeout: Seconds to wait for the cluster and for each operation
+    :return: Connected ceph cluster
+    """
+    conffile, monaddress, clientid, name, keyring = connectionoptions
+    # 0 disables the timeouts, a short time left is never rounded down to it
+    seconds = str(max(int(math.ceil(timeout)), 1))
+    conf = {
+        'rados_mon_op_timeout': seconds,
+        'rados_osd_op_timeout': seconds,
+        'client_mount_timeout': seconds,
+    }
+    if monaddress is not None:
+        conf['mon_host'] = monaddress
+    if keyring is not None:
+        conf['keyring'] = keyring
+    cluster = rados.Rados(conffile=conffile, conf=conf, rados_id=clientid, name=name)
+    try:
+        cluster.connect(timeout=timeout)
+    except rados.Error:
+        cluster.shutdown()
+        raise
+    return cluster
+
+
+def run_command(cluster, command, timeout):
+    """
+    Run a ceph command of the plugin, mon pings included
+    :param cluster: Connected ceph cluster
+    :param command: Ceph command
+    :param timeout: Seconds to wait for the mon
+    :return: Return code, output and status string
+    """
+    if command['prefix'] == 'ping':
+        _, monid = command['mon_id'].split('.', 1)
+        return 0, cluster.ping_monitor(monid).encode(), ''
+    ret, outbuf, outs = cluster.mon_command(json.dumps(command), b'', timeout=timeout)
+    # Some plain text outputs are only sent as the status string
+    return ret, outbuf or outs.encode(), outs
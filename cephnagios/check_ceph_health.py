@@ -21,11 +21,20 @@
 Ceph nagios plugins
 """
 
+from __future__ import annotations
+
 import os
-import subprocess
-import argparse
 import sys
-import json
+
+# Every other module is imported where it is used, most runs only need a few of them.
+# typing is only read by the type checker, annotations are not evaluated at run time
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import io
+    import argparse
+    import socket
+    import types
+    from typing import Any, ClassVar, Dict, List, Optional, Tuple, Union
 
 # nagios exit code
 STATUS_OK = 0
@@ -33,28 +42,305 @@ STATUS_WARNING = 1
 STATUS_ERROR = 2
 STATUS_UNKNOWN = 3
 
+# nagios exit code for each ceph health status
+HEALTH_STATUS_CODES = {
+    'HEALTH_OK': STATUS_OK,
+    'HEALTH_WARN': STATUS_WARNING,
+    'HEALTH_ERR': STATUS_ERROR,
+    'HEALTH_UNKNOWN': STATUS_UNKNOWN,
+}
+# plain text ceph health output starts with the status
+HEALTH_STATUS_PREFIXES = tuple((status.encode(), code) for status, code in HEALTH_STATUS_CODES.items())
+# leading bytes enough to hold the whitespace before a plain text health status
+HEALTH_STATUS_HEAD_SIZE = 32
+# ceph health status or missing object error anywhere in plain text output, compiled by re on first use
+HEALTH_STATUS_RE = rb'HEALTH_(?:OK|WARN|ERR|UNKNOWN)|ObjectNotFound'
+# ceph health status in json output, read without parsing the whole document
+HEALTH_STATUS_JSON_RE = rb'"status"\s*:\s*"(HEALTH_(?:OK|WARN|ERR|UNKNOWN))"'
+
 # default ceph values
 CEPH_COMMAND = '/usr/bin/ceph'
 CEPH_CONFIG = '/etc/ceph/ceph.conf'
+CEPH_ADMIN_SOCKET = '/var/run/ceph/ceph-mon.*.asok'
+CEPH_HELPER_SOCKET = '/run/check_ceph_health.sock'
+
+# seconds for the ceph commands of a check, shared by the helper daemon, the mon admin
+# socket, the rados bindings and the ceph executable. A hung mon must not stack up nagios checks
+CHECK_TIMEOUT = 10
+
+# admin socket values
+# minimum number of commands sent with io_uring
+ADMIN_SOCKET_IOURING_COMMANDS = 3
+# initial size of the ceph executable output buffer
+CLI_OUTPUT_BUFFER_SIZE = 65536
+# minimum paths to check for a single io_uring submission
+STAT_IOURING_PATHS = 3
+# commands not understood by the mon admin socket
+CLI_ONLY_COMMANDS = ('ping',)
+# tries of a ceph command with the rados bindings, reconnecting after a failure
+RADOS_ATTEMPTS = 2
+
+# global options parsed without argparse: short option, long option, destination, takes a value
+FAST_GLOBAL_OPTIONS = (
+    ('e', 'exe', 'exe', True),
+    ('c', 'conf', 'conf', True),
+    ('m', 'monaddress', 'monaddress', True),
+    ('i', 'user', 'clientid', True),
+    ('n', 'name', 'name', True),
+    ('k', 'keyring', 'keyring', True),
+    ('a', 'asok', 'asok', True),
+    ('s', 'helper', 'helper', True),
+    ('u', 'use-cli', 'use_cli', False),
+    ('r', 'raw', 'raw', False),
+)
 
 __version__ = '0.5.1'
 
+if TYPE_CHECKING:
+    # ceph command, as sent to the mon: {'prefix': ..., 'format': ..., arguments}
+    CephCommand = Dict[str, str]
+    # request sent to a socket speaking the admin socket protocol, a ceph command with extra fields
+    SocketRequest = Dict[str, Any]
+    # ceph command output, as read from a socket or the ceph executable
+    CephOutput = Union[bytes, bytearray]
+
+# ceph commands run by the checks, the builders hand out copies. Health is read from
+# json output, the commands only displayed ask for the human readable output
+STATUS_COMMAND = {'prefix': 'status', 'format': 'json'}
+HEALTH_COMMAND = {'prefix': 'health', 'format': 'json'}
+QUORUM_COMMAND = {'prefix': 'quorum_status', 'format': 'json'}
+DF_COMMAND = {'prefix': 'df', 'format': 'plain'}
+PING_COMMAND = {'prefix': 'ping', 'format': 'json'}
+MON_STATUS_COMMAND = {'prefix': 'mon_status', 'format': 'json'}
+MON_STAT_COMMAND = {'prefix': 'mon stat', 'format': 'plain'}
+OSD_STAT_COMMAND = {'prefix': 'osd stat', 'format': 'plain'}
+OSD_TREE_COMMAND = {'prefix': 'osd tree', 'format': 'plain'}
+MDS_STAT_COMMAND = {'prefix': 'mds stat', 'format': 'plain'}
+# human readable output appended as nagios long output, by json ceph command prefix
+LONG_OUTPUT_COMMANDS = {
+    'status': {'prefix': 'status', 'format': 'plain'},
+}
+
+
+class CephCommandError(Exception):
+    """
+    Ceph command failed, the message is the nagios output
+    """
+
+
+def load_iouring_backend() -> Optional[types.ModuleType]:
+    """
+    Import the io_uring backend, found next to this file when run as a script
+    :return: io_uring backend or None if it can not be used
+    """
+    try:
+        try:
+            from . import _iouring_backend
+        except ImportError:
+            import _iouring_backend  # type: ignore[import-not-found,no-redef]
+    except ImportError:
+        return None
+    if not _iouring_backend.available():
+        return None
+    return _iouring_backend
+
+
+def load_rados_backend() -> Optional[types.ModuleType]:
+    """
+    Import the rados bindings backend, found next to this file when run as a script
+    :return: rados bindings backend or None if the rados bindings are not installed
+    """
+    try:
+        try:
+            from . import _rados_backend
+        except ImportError:
+            import _rados_backend  # type: ignore[import-not-found,no-redef]
+    except ImportError:
+        return None
+    return _rados_backend
+
+
+# path existence checks, kept for the process lifetime
+_PATHS_EXIST = dict()  # type: Dict[Tuple[str, ...], Tuple[bool, ...]]
+
+
+def path_exists(path: str) -> bool:
+    """
+    Check if a path exists with a single stat
+    :param path: Path
+    :return: True if path exists False otherwise
+    """
+    try:
+        os.stat(path)
+    except OSError:
+        return False
+    return True
+
+
+def paths_exist(paths: Tuple[str, ...]) -> Tuple[bool, ...]:
+    """
+    Check if paths exist, only once per process for each set of paths. With enough
+    paths and io_uring available, every statx is submitted with a single syscall.
+    A failing io_uring, e.g. denied by seccomp, falls back to one stat per path
+    :param paths: Paths
+    :return: True for each existing path False otherwise
+    """
+    exists = _PATHS_EXIST.get(paths)
+    if exists is None:
+        exists = _stat_paths(paths)
+        _PATHS_EXIST[paths] = exists
+    return exists
+
+
+def _stat_paths(paths: Tuple[str, ...]) -> Tuple[bool, ...]:
+    """
+    Check if paths exist, with io_uring if enough paths are given
+    :param paths: Paths
+    :return: True for each existing path False otherwise
+    """
+    if len(paths) >= STAT_IOURING_PATHS:
+        iouring = load_iouring_backend()
+        if iouring is not None:
+            try:
+                return tuple(iouring.exists_many(paths))
+            except OSError:
+                pass
+    return tuple(path_exists(path) for path in paths)
+
+
+def get_time_left(deadline: float) -> float:
+    """
+    Get the seconds left before a deadline
+    :param deadline: time.monotonic() deadline
+    :return: Seconds left, 0 if the deadline has passed
+    """
+    import time
+    return max(deadline - time.monotonic(), 0.0)
+
+
+class CephAdminSocketClient:
+    """
+    Client for a ceph daemon admin socket
+    """
+    __slots__ = ('_path', '_timeout')
+
+    def __init__(self, path: str, timeout: float) -> None:
+        self._path = path
+        self._timeout = timeout
+
+    @property
+    def path(self) -> str:
+        """
+        Get admin socket path
+        :return: admin socket path
+        """
+        return self._path
+
+    def _recv_exact(self, sock: socket.socket, size: int) -> bytes:
+        """
+        Read exactly size bytes from socket
+        :param sock: Connected socket
+        :param size: Number of bytes to read
+        :return: Bytes read
+        """
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('Admin socket closed - {0}'.format(self._path))
+            data.extend(chunk)
+        return bytes(data)
+
+    def run_commands(self, commands: List[SocketRequest]) -> List[bytes]:
+        """
+        Send commands to the admin socket. The request is a NUL terminated json
+        string and the reply is prefixed with its length as a 4-byte big endian.
+        The admin socket answers one command per connection, so every request
+        is sent before reading the first reply
+        :param commands: Ceph commands
+        :return: Ceph commands output
+        """
+        import json
+        import socket
+        socks = list()
+        try:
+            for command in commands:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                socks.append(sock)
+                sock.settimeout(self._timeout)
+                sock.connect(self._path)
+            requests = [json.dumps(command).encode() + b'\0' for command in commands]
+            self._send_requests(socks, requests)
+            return [self._read_reply(sock) for sock in socks]
+        finally:
+            for sock in socks:
+                sock.close()
+
+    def _send_requests(self, socks: List[socket.socket], requests: List[bytes]) -> None:
+        """
+        Send requests. With enough requests and io_uring available, every send is
+        submitted with a single syscall. The replies are read with the socket timeout,
+        a receive queued on these non blocking sockets would complete with EAGAIN
+        :param socks: Connected sockets
+        :param requests: Request for each socket
+        """
+        if len(requests) >= ADMIN_SOCKET_IOURING_COMMANDS:
+            iouring = load_iouring_backend()
+            if iouring is not None:
+                iouring.send_many([(sock.fileno(), request) for sock, request in zip(socks, requests)])
+                return
+        for sock, request in zip(socks, requests):
+            sock.sendall(request)
+
+    def _read_reply(self, sock: socket.socket) -> bytes:
+        """
+        Read a length prefixed reply
+        :param sock: Connected socket
+        :return: Reply payload
+        """
+        import struct
+        length, = struct.unpack('>I', self._recv_exact(sock, 4))
+        return self._recv_exact(sock, length)
+
 
 class CephCommandBase:
     """
     Base class
     """
-    def __init__(self, cliargs):
-        self._cephexec = getattr(cliargs, 'exe')
-        self._cephconf = getattr(cliargs, 'conf')
-        self._monaddress = getattr(cliargs, 'monaddress')
-        self._clientid = getattr(cliargs, 'clientid')
-        self._name = getattr(cliargs, 'name')
-        self._keyring = getattr(cliargs, 'keyring')
+    __slots__ = ('_cephexec', '_cephconf', '_monaddress', '_clientid', '_name', '_keyring', '_asok', '_helper',
+                 '_usecli', '_cluster', '_radosfailed', '_nagiosmessage', '_cephexecexists', '_cephconfexists',
+                 '_keyringexists', '_clibasecmd')
+    # Connected rados handles by connection options, shared by every command object
+    _HANDLE_POOL = dict()  # type: ClassVar[Dict[Tuple[Optional[str], ...], Any]]
+
+    def __init__(self, cliargs: Any) -> None:
+        # Resolve the defaults once, an empty value selects the default
+        # Options missing from the namespace are unset
+        options = vars(cliargs)
+        self._cephexec = options.get('exe') or CEPH_COMMAND  # type: str
+        self._cephconf = options.get('conf') or CEPH_CONFIG  # type: str
+        self._monaddress = options.get('monaddress')
+        self._clientid = options.get('clientid')
+        self._name = options.get('name')
+        self._keyring = options.get('keyring')
+        self._asok = options.get('asok')
+        self._helper = options.get('helper')
+        self._usecli = bool(options.get('use_cli'))
+        self._cluster = None  # type: Any
+        self._radosfailed = False
         self._nagiosmessage = ''
+        # These only depend on the command line arguments, compute them once
+        # An executable without a directory is searched in PATH by the kernel
+        cephexecpath = self._cephexec if os.sep in self._cephexec else None
+        paths = tuple(path for path in (cephexecpath, self._cephconf, self._keyring) if path is not None)
+        exists = dict(zip(paths, paths_exist(paths)))
+        self._cephexecexists = cephexecpath is None or exists[cephexecpath]
+        self._cephconfexists = exists[self._cephconf]
+        self._keyringexists = self._keyring is None or exists[self._keyring]
+        self._clibasecmd = tuple(self._compute_cli_base_command())
 
     @property
-    def cephexec(self):
+    def cephexec(self) -> str:
         """
         Get ceph executable
         :return: ceph executable
@@ -62,7 +348,7 @@ class CephCommandBase:
         return self._cephexec
 
     @property
-    def cephconf(self):
+    def cephconf(self) -> str:
         """
         Get ceph config file
         :return: ceph config file
@@ -70,7 +356,7 @@ class CephCommandBase:
         return self._cephconf
 
     @property
-    def monaddress(self):
+    def monaddress(self) -> Optional[str]:
         """
         Get mon address
         :return: mon address
@@ -78,7 +364,7 @@ class CephCommandBase:
         return self._monaddress
 
     @property
-    def clientid(self):
+    def clientid(self) -> Optional[str]:
         """
         Get mon id
         :return: Mon id
@@ -86,7 +372,7 @@ class CephCommandBase:
         return self._clientid
 
     @property
-    def name(self):
+    def name(self) -> Optional[str]:
         """
         Get client name for authentication
         :return: Client name
@@ -94,7 +380,7 @@ class CephCommandBase:
         return self._name
 
     @property
-    def keyring(self):
+    def keyring(self) -> Optional[str]:
         """
         Get keyring
         :return: Keyring
@@ -102,62 +388,427 @@ class CephCommandBase:
         return self._keyring
 
     @property
-    def nagiosmessage(self):
+    def asok(self) -> Optional[str]:
+        """
+        Get mon admin socket
+        :return: mon admin socket
+        """
+        return self._asok
+
+    @property
+    def helper(self) -> Optional[str]:
+        """
+        Get helper daemon socket
+        :return: helper daemon socket
+        """
+        return self._helper
+
+    @property
+    def usecli(self) -> bool:
+        """
+        Get if the ceph executable is used instead of the rados bindings
+        :return: True if the rados bindings are not used
+        """
+        return self._usecli
+
+    @property
+    def globaloptions(self) -> Tuple[Any, ...]:
+        """
+        Get the command line options shared by every command of this object
+        :return: Global command line options
+        """
+        return (self._cephexec, self._cephconf, self._monaddress, self._clientid, self._name, self._keyring,
+                self._asok, self._helper, self._usecli)
+
+    @property
+    def connectionoptions(self) -> Tuple[Optional[str], ...]:
+        """
+        Get the command line options used to connect with the rados bindings
+        :return: Connection options
+        """
+        return self._cephconf, self._monaddress, self._clientid, self._name, self._keyring
+
+    @property
+    def nagiosmessage(self) -> str:
         """
         Get nagios message
         :return: nagios message
         """
         return self._nagiosmessage
 
-    @nagiosmessage.setter
-    def nagiosmessage(self, newmessage):
+    def build_base_command(self, command: CephCommand) -> Optional[CephCommand]:
+        """
+        Build ceph command from common command line arguments
+        :param command: Ceph command constant
+        :return: Ceph command or None if ceph conf or keyring file is missing
+        """
+        if not self._cephconfexists:
+            self._nagiosmessage = 'ERROR: No such file - {0}'.format(self._cephconf)
+            return None
+        if not self._keyringexists:
+            self._nagiosmessage = 'ERROR: No such file - {0}'.format(self._keyring)
+            return None
+        return dict(command)
+
+    def _compute_cli_base_command(self) -> List[str]:
+        """
+        Compute ceph cli arguments from common command line arguments
+        :return: Ceph cli base command
+        """
+        clicmd = [self._cephexec, '-c', self._cephconf]
+        options = (('-m', self._monaddress), ('--id', self._clientid), ('--name', self._name),
+                   ('--keyring', self._keyring))
+        for flag, value in options:
+            if value is not None:
+                clicmd += (flag, value)
+        return clicmd
+
+    def build_cli_base_command(self) -> List[str]:
+        """
+        Build ceph cli arguments from common command line arguments
+        :return: Ceph cli base command
+        """
+        return list(self._clibasecmd)
+
+    def build_cli_command(self, command: CephCommand) -> List[str]:
+        """
+        Build ceph cli arguments for a ceph command
+        :param command: Ceph command
+        :return: Ceph cli command
+        """
+        clicmd = self.build_cli_base_command()
+        clicmd.extend(get_command_arguments(command))
+        clicmd.extend(('-f', command['format']))
+        return clicmd
+
+    def find_admin_socket(self) -> Optional[str]:
+        """
+        Find the local mon admin socket. The default socket answers for the local
+        cluster only, it is not used with any other connection option than the defaults
+        :return: Admin socket path or None
+        """
+        asok = self._asok
+        if asok is None:
+            if self.connectionoptions != (CEPH_CONFIG, None, None, None, None):
+                return None
+            asok = CEPH_ADMIN_SOCKET
+        if not asok:
+            return None
+        import glob
+        sockets = sorted(glob.glob(asok))
+        if not sockets:
+            return None
+        return sockets[0]
+
+    def run_socket_commands(self, path: Optional[str], commands: List[SocketRequest], deadline: float,
+                            excluded: Tuple[str, ...] = (), plaintext: bool = False) -> List[Optional[CephOutput]]:
+        """
+        Run ceph commands through a socket speaking the admin socket protocol
+        :param path: Socket path or None
+        :param commands: Ceph commands
+        :param deadline: time.monotonic() deadline of the check
+        :param excluded: Command prefixes not understood by the socket
+        :param plaintext: True if the socket runs plain text commands, its errors starting with ERROR
+        :return: Ceph commands output, None for commands the socket could not run
+        """
+        results = [None] * len(commands)  # type: List[Optional[CephOutput]]
+        if path is None:
+            return results
+        pending = [index for index, command in enumerate(commands)
+                   if command['prefix'] not in excluded and (plaintext or command['format'] == 'json')]
+        if not pending:
+            return results
+        try:
+            replies = CephAdminSocketClient(path, get_time_left(deadline)).run_commands(
+                [commands[index] for index in pending])
+        except OSError:
+            return results
+        for index, reply in zip(pending, replies):
+            # Unknown or failed commands are answered with a plain text error
+            if commands[index]['format'] == 'json':
+                if reply.startswith((b'{', b'[')):
+                    results[index] = reply
+            elif not reply.startswith(b'ERROR'):
+                results[index] = reply
+        return results
+
+    def run_admin_socket_commands(self, commands: List[CephCommand], deadline: float) -> List[Optional[CephOutput]]:
+        """
+        Run ceph commands through the mon admin socket
+        :param commands: Ceph commands
+        :param deadline: time.monotonic() deadline of the check
+        :return: Ceph commands output, None for commands the admin socket could not run
+        """
+        return self.run_socket_commands(self.find_admin_socket(), commands, deadline, CLI_ONLY_COMMANDS)
+
+    def run_helper_commands(self, commands: List[CephCommand], deadline: float) -> List[Optional[CephOutput]]:
+        """
+        Run ceph commands through the helper daemon. The connection options are sent
+        along, the helper daemon refuses commands for a connection it does not serve
+        :param commands: Ceph commands
+        :param deadline: time.monotonic() deadline of the check
+        :return: Ceph commands output, None for commands the helper daemon could not run
+        """
+        requests = list()  # type: List[SocketRequest]
+        for command in commands:
+            request = dict(command)  # type: SocketRequest
+            request['connection'] = self.connectionoptions
+            requests.append(request)
+        return self.run_socket_commands(self._helper or None, requests, deadline, plaintext=True)
+
+    @classmethod
+    def _get_handle(cls, backend: types.ModuleType, key: Tuple[Optional[str], ...], timeout: float) -> Any:
         """
-        Set new nagios message
-        :param newmessage: New nagios message
+        Get a connected rados handle from the pool, connecting a new one if missing or no longer connected
+        :param backend: rados bindings backend
+        :param key: Connection options
+        :param timeout: Seconds to wait for the cluster, kept by a new handle for its operations
+        :return: Connected rados handle
         """
-        self._nagiosmessage = newmessage
+        handle = cls._HANDLE_POOL.get(key)
+        if handle is None or handle.state != 'connected':
+            handle = backend.connect_cluster(key, timeout)
+            cls._HANDLE_POOL[key] = handle
+            import atexit
+            atexit.register(handle.shutdown)
+        return handle
 
-    def build_base_command(self):
+    @classmethod
+    def _evict_handle(cls, key: Tuple[Optional[str], ...]) -> None:
         """
-        Build base ceph command from common command line arguments
-        :return: Ceph base command
+        Drop a rados handle from the pool
+        :param key: Connection options
         """
-        basecmd = list()
-        basecmd.append(self.cephexec)
-        if self.cephconf is not None:
-            if not os.path.exists(self.cephconf):
-                self._nagiosmessage = 'ERROR: No such file - {0}'.format(self.cephconf)
-                return False
-            basecmd.extend('-c {0}'.format(self.cephconf).split())
-        if self.monaddress is not None:
-            basecmd.extend('-m {0}'.format(self.monaddress).split())
-        if self.clientid is not None:
-            basecmd.extend('--id {0}'.format(self.clientid).split())
-        if self.name is not None:
-            basecmd.extend('--name {0}'.format(self.name).split())
-        if self.keyring is not None:
-            basecmd.extend('--keyring {0}'.format(self.keyring).split())
-        return basecmd
+        handle = cls._HANDLE_POOL.pop(key, None)
+        if handle is not None:
+            handle.shutdown()
 
-    def run_ceph_command(self, command):
+    def connect(self, deadline: float) -> Any:
         """
-        Run ceph command
+        Connect to the ceph cluster with the rados bindings. The handle is shared with
+        every command object using the same connection options
+        :param deadline: time.monotonic() deadline of the check
+        :return: Ceph cluster connection or None if rados is not available or the connection failed
+        """
+        if self._cluster is None and not self._usecli and not self._radosfailed:
+            backend = load_rados_backend()
+            if backend is None:
+                # Do not retry a missing module for every command
+                self._radosfailed = True
+                return None
+            import rados  # type: ignore
+            try:
+                self._cluster = self._get_handle(backend, self.connectionoptions, get_time_left(deadline))
+            except rados.Error:
+                # Do not retry an unreachable cluster for every command
+                self._radosfailed = True
+        return self._cluster
+
+    def run_rados_command(self, command: CephCommand, deadline: float) -> Optional[bytes]:
+        """
+        Run ceph command with the rados bindings, reconnecting once if the handle fails.
+        mon_command reports a lost or timed out mon session with a negative return code
         :param command: Ceph command
+        :param deadline: time.monotonic() deadline of the check
+        :return: Ceph command output or None if the command failed
+        """
+        backend = load_rados_backend()
+        if backend is None:
+            return None
+        import rados
+        for _ in range(RADOS_ATTEMPTS):
+            timeout = get_time_left(deadline)
+            cluster = self.connect(deadline) if timeout else None
+            if cluster is None:
+                return None
+            try:
+                ret, output, _ = backend.run_command(cluster, command, timeout)
+            except rados.ObjectNotFound:
+                # Unknown mon, not a handle failure
+                return None
+            except rados.Error:
+                ret = -1
+            if ret < 0:
+                self._evict_handle(self.connectionoptions)
+                self._cluster = None
+                continue
+            if ret != 0:
+                return None
+            return output
+        return None
+
+    def run_rados_commands(self, commands: List[CephCommand], deadline: float) -> List[Optional[CephOutput]]:
+        """
+        Run ceph commands with the rados bindings. Not used with --use-cli
+        :param commands: Ceph commands
+        :param deadline: time.monotonic() deadline of the check
+        :return: Ceph commands output, None for commands the rados bindings could not run
+        """
+        if self.connect(deadline) is None:
+            return [None] * len(commands)
+        return [self.run_rados_command(command, deadline) for command in commands]
+
+    def run_cli_command(self, command: List[str], deadline: float) -> bytearray:
+        """
+        Run ceph command with the ceph executable
+        :param command: Ceph cli command
+        :param deadline: time.monotonic() deadline of the check
         :return: Ceph command output
         """
+        import subprocess
+        import selectors
+        from typing import cast
+        # Never add a preexec_fn, it keeps subprocess from using posix_spawn
         try:
-            runcmd = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True)
-            rescmd = runcmd.stdout.decode()
+            proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
         except OSError:
-            print('ERROR: Ceph executable not found - {0}'.format(self.cephexec))
-            sys.exit(STATUS_ERROR)
-        except subprocess.CalledProcessError as error:
-            print('ERROR running ceph command: {0}'.format(error.output.decode()))
-            print('Ceph command: {0}'.format(command))
-            sys.exit(STATUS_ERROR)
+            raise CephCommandError('ERROR: Ceph executable not found - {0}'.format(self._cephexec))
+        # Read straight into one buffer, grown as needed and truncated to the output size
+        rescmd = bytearray(CLI_OUTPUT_BUFFER_SIZE)
+        offset = 0
+        # Unbuffered pipe, a raw file object
+        stdout = cast('io.RawIOBase', proc.stdout)
+        with proc, selectors.DefaultSelector() as selector:
+            selector.register(stdout, selectors.EVENT_READ)
+            while True:
+                if not selector.select(get_time_left(deadline)):
+                    proc.kill()
+                    raise CephCommandError('ERROR: Ceph command timed out after {0} seconds\n'
+                                           'Ceph command: {1}'.format(CHECK_TIMEOUT, command))
+                if offset == len(rescmd):
+                    rescmd.extend(bytes(len(rescmd)))
+                with memoryview(rescmd) as view, view[offset:] as tail:
+                    nbytes = stdout.readinto(tail)
+                if not nbytes:
+                    break
+                offset += nbytes
+        del rescmd[offset:]
+        if proc.returncode != 0:
+            raise CephCommandError('ERROR running ceph command: {0}\nCeph command: {1}'.format(rescmd.decode(),
+                                                                                             command))
         return rescmd
 
-    def __str__(self):
+    async def run_cli_command_async(self, command: List[str], deadline: float) -> Tuple[bytes, Optional[str]]:
+        """
+        Run ceph command with the ceph executable, without blocking the event loop.
+        Errors are returned, exiting would leave the other commands of the event loop behind
+        :param command: Ceph cli command
+        :param deadline: time.monotonic() deadline of the check
+        :return: Ceph command output and error message, None if the command succeeded
+        """
+        import asyncio
+        import subprocess
+        try:
+            proc = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError:
+            return b'', 'ERROR: Ceph executable not found - {0}'.format(self._cephexec)
+        try:
+            rescmd, _ = await asyncio.wait_for(proc.communicate(), get_time_left(deadline))
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return b'', 'ERROR: Ceph command timed out after {0} seconds\nCeph command: {1}'.format(CHECK_TIMEOUT,
+                                                                                                    command)
+        if proc.returncode != 0:
+            return rescmd, 'ERROR running ceph command: {0}\nCeph command: {1}'.format(rescmd.decode(), command)
+        return rescmd, None
+
+    async def run_cli_commands_async(self, commands: List[List[str]],
+                                     deadline: float) -> List[Tuple[bytes, Optional[str]]]:
+        """
+        Run ceph commands with one ceph executable each, all of them at the same time
+        :param commands: Ceph cli commands
+        :param deadline: time.monotonic() deadline of the check
+        :return: Ceph command output and error message of each command
+        """
+        import asyncio
+        return list(await asyncio.gather(*(self.run_cli_command_async(command, deadline) for command in commands)))
+
+    def run_cli_stdin_commands(self, commands: List[CephCommand], deadline: float) -> Optional[List[CephOutput]]:
+        """
+        Run json ceph commands with a single ceph executable reading them from stdin
+        :param commands: Ceph commands
+        :param deadline: time.monotonic() deadline of the check
+        :return: Ceph commands output or None if the output can not be split
+        """
+        import shlex
+        import subprocess
+        clicmd = self.build_cli_base_command()
+        clicmd.extend(('-f', 'json'))
+        cmdinput = '\n'.join(' '.join(map(shlex.quote, get_command_arguments(command))) for command in commands)
+        try:
+            runcmd = subprocess.run(clicmd, input=cmdinput.encode(), stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, timeout=get_time_left(deadline))
+        except OSError:
+            raise CephCommandError('ERROR: Ceph executable not found - {0}'.format(self._cephexec))
+        except subprocess.TimeoutExpired:
+            raise CephCommandError('ERROR: Ceph command timed out after {0} seconds\n'
+                                   'Ceph command: {1}'.format(CHECK_TIMEOUT, clicmd))
+        if runcmd.returncode != 0:
+            return None
+        results = split_json_output(runcmd.stdout)
+        if len(results) != len(commands):
+            return None
+        return results
+
+    def run_cli_commands(self, commands: List[CephCommand], deadline: float) -> List[CephOutput]:
+        """
+        Run ceph commands with a single ceph executable reading them from stdin.
+        Falls back to concurrent ceph executables, one per command, if the output can not be split
+        :param commands: Ceph commands
+        :param deadline: time.monotonic() deadline of the check
+        :return: Ceph commands output
+        """
+        if not self._cephexecexists:
+            raise CephCommandError('ERROR: Ceph executable not found - {0}'.format(self._cephexec))
+        if len(commands) == 1:
+            return [self.run_cli_command(self.build_cli_command(commands[0]), deadline)]
+        # Only json output can be split into the output of each command
+        if all(command['format'] == 'json' for command in commands):
+            results = self.run_cli_stdin_commands(commands, deadline)
+            if results is not None:
+                return results
+        import asyncio
+        clicmds = [self.build_cli_command(command) for command in commands]
+        outputs = asyncio.run(self.run_cli_commands_async(clicmds, deadline))
+        for _, error in outputs:
+            if error is not None:
+                raise CephCommandError(error)
+        return [output for output, _ in outputs]
+
+    def run_ceph_command(self, command: CephCommand) -> CephOutput:
+        """
+        Run ceph command. The helper daemon, the mon admin socket and the rados bindings
+        are tried first, falling back to the ceph executable
+        :param command: Ceph command
+        :return: Ceph command output
+        """
+        return self.run_ceph_commands([command])[0]
+
+    def run_ceph_commands(self, commands: List[CephCommand]) -> List[CephOutput]:
+        """
+        Run ceph commands in a single round of each of the helper daemon, the mon admin
+        socket, the rados bindings and the ceph executable, each one running the commands
+        left by the previous. They share a single deadline, CHECK_TIMEOUT seconds from now
+        :param commands: Ceph commands
+        :return: Ceph commands output
+        """
+        import time
+        deadline = time.monotonic() + CHECK_TIMEOUT
+        results = [None] * len(commands)  # type: List[Optional[CephOutput]]
+        for runner in (self.run_helper_commands, self.run_admin_socket_commands, self.run_rados_commands,
+                       self.run_cli_commands):
+            pending = [index for index, result in enumerate(results) if result is None]
+            if not pending:
+                break
+            if not get_time_left(deadline):
+                raise CephCommandError('ERROR: Ceph command timed out after {0} seconds'.format(CHECK_TIMEOUT))
+            for index, result in zip(pending, runner([commands[index] for index in pending], deadline)):
+                results[index] = result
+        # The ceph executable runs every command left
+        return [result if result is not None else b'' for result in results]
+
+    def __str__(self) -> str:
         return '{0}'.format(self.nagiosmessage)
 
 
@@ -165,72 +816,72 @@ class CommonCephCommand(CephCommandBase):
     """
     Class for common command
     """
-    def __init__(self, cliargs):
-        self._status = getattr(cliargs, 'status')
-        self._health = getattr(cliargs, 'health')
-        self._quorum = getattr(cliargs, 'quorum')
-        self._df = getattr(cliargs, 'df')
+    __slots__ = ('_status', '_health', '_quorum', '_df')
+
+    def __init__(self, cliargs: Any) -> None:
+        options = vars(cliargs)
+        self._status = options.get('status', False)
+        self._health = options.get('health', False)
+        self._quorum = options.get('quorum', False)
+        self._df = options.get('df', False)
         super(CommonCephCommand, self).__init__(cliargs)
 
     @property
-    def status(self):
+    def status(self) -> bool:
         """
         :return: True if status is defined False otherwise
         """
         return self._status
 
     @property
-    def health(self):
+    def health(self) -> bool:
         """
         :return: True if health is defined False otherwise
         """
         return self._health
 
     @property
-    def quorum(self):
+    def quorum(self) -> bool:
         """
         :return: True if quorum is defined False otherwise
         """
         return self._quorum
 
     @property
-    def dfcmd(self):
+    def dfcmd(self) -> bool:
         """
         :return: True if df is defined False otherwise
         """
         return self._df
 
-    def build_common_command(self):
+    def build_common_command(self) -> Optional[CephCommand]:
         """
         :return: Ceph common command
         """
-        cmd = self.build_base_command()
-        if not cmd:
-            return False
-        if self.status:
-            cmd.append('status')
-        elif self.health:
-            cmd.append('health')
-        elif self.quorum:
-            cmd.append('quorum_status')
-        else:
-            cmd.append('df')
-        return cmd
+        if self._status:
+            return self.build_base_command(STATUS_COMMAND)
+        if self._health:
+            return self.build_base_command(HEALTH_COMMAND)
+        if self._quorum:
+            return self.build_base_command(QUORUM_COMMAND)
+        return self.build_base_command(DF_COMMAND)
 
 
 class MonCephCommand(CephCommandBase):
     """
     Class for mon command
     """
+    __slots__ = ('_monhealth', '_monstatus', '_monstat')
 
-    def __init__(self, cliargs):
-        self._monhealth = getattr(cliargs, 'monid')
-        self._monstatus = getattr(cliargs, 'monstatus')
-        self._monstat = getattr(cliargs, 'monstat')
+    def __init__(self, cliargs: Any) -> None:
+        options = vars(cliargs)
+        self._monhealth = options.get('monid')
+        self._monstatus = options.get('monstatus', False)
+        self._monstat = options.get('monstat', False)
         super(MonCephCommand, self).__init__(cliargs)
 
     @property
-    def monhealth(self):
+    def monhealth(self) -> Optional[str]:
         """
         Get monhealth value
         :return: monhealth value
@@ -238,100 +889,123 @@ class MonCephCommand(CephCommandBase):
         return self._monhealth
 
     @property
-    def monstatus(self):
+    def monstatus(self) -> bool:
         """
         :return: True if monstatus is defined False otherwise
         """
         return self._monstatus
 
     @property
-    def monstat(self):
+    def monstat(self) -> bool:
         """
         :return: True if monstat is defined False otherwise
         """
         return self._monstat
 
-    def build_mon_command(self):
+    def build_mon_command(self) -> Optional[CephCommand]:
         """
         :return: Ceph mon command
         """
-        cmd = self.build_base_command()
-        if self.monhealth:
-            cmd.extend('ping mon.{0}'.format(self.monhealth).split())
-        elif self.monstatus:
-            cmd.append('mon_status')
-        elif self.monstat:
-            cmd.extend('mon stat'.split())
-        return cmd
+        if self._monhealth:
+            cmd = self.build_base_command(PING_COMMAND)
+            if cmd:
+                cmd['mon_id'] = 'mon.{0}'.format(self._monhealth)
+            return cmd
+        if self._monstatus:
+            return self.build_base_command(MON_STATUS_COMMAND)
+        return self.build_base_command(MON_STAT_COMMAND)
 
 
 class OsdCephCommand(CephCommandBase):
     """
     Class for osd command
     """
+    __slots__ = ('_osdstat', '_osdtree')
 
-    def __init__(self, cliargs):
-        self._osdstat = getattr(cliargs, 'stat')
-        self._osdtree = getattr(cliargs, 'tree')
+    def __init__(self, cliargs: Any) -> None:
+        options = vars(cliargs)
+        self._osdstat = options.get('stat', False)
+        self._osdtree = options.get('tree', False)
         super(OsdCephCommand, self).__init__(cliargs)
 
     @property
-    def osdstat(self):
+    def osdstat(self) -> bool:
         """
         :return: True if osdstat is defined False otherwise
         """
         return self._osdstat
 
     @property
-    def osdtree(self):
+    def osdtree(self) -> bool:
         """
         :return: True if osdtree is defined False otherwise
         """
         return self._osdtree
 
-    def build_osd_command(self):
+    def build_osd_command(self) -> Optional[CephCommand]:
         """
         :return: Ceph osd command
         """
-        cmd = self.build_base_command()
-        cmd.append('osd')
-        if self.osdstat:
-            cmd.append('stat')
-        else:
-            cmd.append('tree')
-        return cmd
+        if self._osdstat:
+            return self.build_base_command(OSD_STAT_COMMAND)
+        return self.build_base_command(OSD_TREE_COMMAND)
 
 
 class MdsCephCommand(CephCommandBase):
     """
     Class for mds command
     """
+    __slots__ = ('_mdsstat',)
 
-    def __init__(self, cliargs):
-        self._mdsstat = getattr(cliargs, 'mdsstat')
+    def __init__(self, cliargs: Any) -> None:
+        self._mdsstat = vars(cliargs).get('mdsstat', False)
         super(MdsCephCommand, self).__init__(cliargs)
 
     @property
-    def mdsstat(self):
+    def mdsstat(self) -> bool:
         """
         :return: True if mdsstat is defined False otherwise
         """
         return self._mdsstat
 
-    def build_mds_command(self):
+    def build_mds_command(self) -> Optional[CephCommand]:
         """
         :return: Ceph mds command
         """
-        cmd = self.build_base_command()
-        cmd.extend('mds stat'.split())
-        return cmd
+        return self.build_base_command(MDS_STAT_COMMAND)
+
+
+# subcommands: help, command class, command builder and mutually exclusive options.
+# Options are (flag, destination, help), only options taking a value have a destination
+SUBCOMMANDS = {
+    'common': ('Ceph common options', CommonCephCommand, CommonCephCommand.build_common_command, (
+        ('status', None, 'Show ceph status'),
+        ('health', None, 'Show ceph health'),
+        ('quorum', None, 'Show ceph quorum'),
+        ('df', None, 'Show ceph pools status'),
+    )),
+    'mon': ('Ceph monitor options', MonCephCommand, MonCephCommand.build_mon_command, (
+        ('monhealth', 'monid', 'Check mon health status'),
+        ('monstatus', None, 'Show ceph mon status'),
+        ('monstat', None, 'Show Ceph mon stat'),
+    )),
+    'osd': ('Ceph osd options', OsdCephCommand, OsdCephCommand.build_osd_command, (
+        ('stat', None, 'Show ceph osd status'),
+        ('tree', None, 'Show Ceph osd tree'),
+    )),
+    'mds': ('Ceph mds options', MdsCephCommand, MdsCephCommand.build_mds_command, (
+        ('mdsstat', None, 'Show ceph mds status'),
+    )),
+}  # type: Dict[str, Tuple[str, Any, Any, Tuple[Tuple[str, Optional[str], str], ...]]]
 
 
-def _parse_arguments():
+def _parse_arguments() -> 'argparse.ArgumentParser':
     """
     Parse command line arguments
     :return: Command line arguments
     """
+    import io
+    import argparse
     parser = argparse.ArgumentParser(description='ceph nagios plugin')
     parser.add_argument('-e', '--exe', default=CEPH_COMMAND, help='ceph executable [{0}]'.format(CEPH_COMMAND))
     parser.add_argument('-c', '--conf', default=CEPH_CONFIG, help='alternative ceph conf file [{0}]'.format(CEPH_CONFIG))
@@ -339,120 +1013,350 @@ def _parse_arguments():
     parser.add_argument('-i', '--user', dest='clientid', help='ceph client id')
     parser.add_argument('-n', '--name', help='ceph client name')
     parser.add_argument('-k', '--keyring', help='ceph client keyring file')
+    parser.add_argument('-a', '--asok',
+                        help='ceph mon admin socket, empty to disable [{0}, only without -c, -m, -i, -n and -k]'.format(
+                            CEPH_ADMIN_SOCKET))
+    parser.add_argument('-s', '--helper', default=CEPH_HELPER_SOCKET,
+                        help='check_ceph_helperd socket, empty to disable [{0}]'.format(CEPH_HELPER_SOCKET))
+    parser.add_argument('-u', '--use-cli', action='store_true',
+                        help='use the ceph executable instead of the python rados bindings')
+    parser.add_argument('-b', '--batch', metavar='FILE',
+                        help='run the checks listed in FILE, one "SERVICE COMMAND [OPTIONS]" per line')
+    parser.add_argument('-r', '--raw', action='store_true',
+                        help='replace the plugin with the ceph executable, its output and exit code are not translated')
     parser.add_argument('--version', action='version', version='%(prog)s {0}'.format(__version__))
 
     subparsers = parser.add_subparsers(help='Ceph commands options help')
+    for subcommand, (subcommandhelp, handler, builder, options) in SUBCOMMANDS.items():
+        subparser = subparsers.add_parser(subcommand, help=subcommandhelp)
+        subparser.set_defaults(handler=handler, builder=builder)
+        subparsergrp = subparser.add_mutually_exclusive_group()
+        for flag, dest, flaghelp in options:
+            if dest is None:
+                subparsergrp.add_argument('--' + flag, action='store_true', help=flaghelp)
+            else:
+                subparsergrp.add_argument('--' + flag, dest=dest, help=flaghelp)
 
-    cephcommonparser = subparsers.add_parser('common', help='Ceph common options')
-    cephcommonparsergrp = cephcommonparser.add_mutually_exclusive_group()
-    cephcommonparsergrp.add_argument('--status', action='store_true', help='Show ceph status')
-    cephcommonparsergrp.add_argument('--health', action='store_true', help='Show ceph health')
-    cephcommonparsergrp.add_argument('--quorum', action='store_true', help='Show ceph quorum')
-    cephcommonparsergrp.add_argument('--df', action='store_true', help='Show ceph pools status')
+    return parser
 
-    cephmonparser = subparsers.add_parser('mon', help='Ceph monitor options')
-    cephmonparsergrp = cephmonparser.add_mutually_exclusive_group()
-    cephmonparsergrp.add_argument('--monhealth', dest='monid', help='Check mon health status')
-    cephmonparsergrp.add_argument('--monstatus', action='store_true', help='Show ceph mon status')
-    cephmonparsergrp.add_argument('--monstat', action='store_true', help='Show Ceph mon stat')
 
-    cephosdparser = subparsers.add_parser('osd', help='Ceph osd options')
-    cephosdparsergrp = cephosdparser.add_mutually_exclusive_group()
-    cephosdparsergrp.add_argument('--stat', action='store_true', help='Show ceph osd status')
-    cephosdparsergrp.add_argument('--tree', action='store_true', help='Show Ceph osd tree')
+def _parse_fast_arguments(argv: List[str]) -> Optional[types.SimpleNamespace]:
+    """
+    Parse global options and a single subcommand flag without building the argparse parser.
+    Help, version, batch mode and errors are left to argparse
+    :param argv: Command line arguments
+    :return: Command line arguments or None if argv needs the full parser
+    """
+    import getopt
+    import types
+    shortopts = ''.join(short + ':' if hasvalue else short for short, _, _, hasvalue in FAST_GLOBAL_OPTIONS)
+    longopts = [long + '=' if hasvalue else long for _, long, _, hasvalue in FAST_GLOBAL_OPTIONS]
+    # argparse does not accept the end of options marker before the subcommand
+    if '--' in argv:
+        return None
+    try:
+        # getopt stops at the subcommand, as argparse does with global options
+        options, argv = getopt.getopt(argv, shortopts, longopts)
+    except getopt.GetoptError:
+        return None
+    if len(argv) not in (2, 3) or argv[0] not in SUBCOMMANDS:
+        return None
+    _, handler, builder, suboptions = SUBCOMMANDS[argv[0]]
+    arguments = types.SimpleNamespace(exe=CEPH_COMMAND, conf=CEPH_CONFIG, monaddress=None, clientid=None,
+                                      name=None, keyring=None, asok=None,
+                                      helper=CEPH_HELPER_SOCKET, use_cli=False, batch=None,
+                                      raw=False)
+    for option, value in options:
+        for short, long, dest, hasvalue in FAST_GLOBAL_OPTIONS:
+            if option in ('-' + short, '--' + long):
+                setattr(arguments, dest, value if hasvalue else True)
+                break
+    arguments.handler, arguments.builder = handler, builder
+    selected = None
+    for flag, flagdest, _ in suboptions:
+        if flagdest is None:
+            setattr(arguments, flag, False)
+        else:
+            setattr(arguments, flagdest, None)
+        if argv[1] == '--' + flag:
+            selected = (flag, flagdest)
+    if selected is None:
+        return None
+    flag, flagdest = selected
+    if flagdest is None and len(argv) == 2:
+        setattr(arguments, flag, True)
+    elif flagdest is not None and len(argv) == 3 and not argv[2].startswith('-'):
+        setattr(arguments, flagdest, argv[2])
+    else:
+        return None
+    return arguments
 
-    cephmdsparser = subparsers.add_parser('mds', help='Ceph mds options')
-    cephmdsparsergrp = cephmdsparser.add_mutually_exclusive_group()
-    cephmdsparsergrp.add_argument('--mdsstat', action='store_true', help='Show ceph mds status')
 
-    return parser
+def get_command_arguments(command: CephCommand) -> List[str]:
+    """
+    Get ceph cli arguments for a ceph command, without format
+    :param command: Ceph command
+    :return: Ceph cli arguments
+    """
+    arguments = command['prefix'].split()
+    arguments.extend(value for key, value in command.items() if key not in ('prefix', 'format'))
+    return arguments
+
+
+def split_json_output(output: CephOutput) -> List[CephOutput]:
+    """
+    Split the output of several ceph commands into one json document per command
+    :param output: Ceph commands output
+    :return: Json documents, empty if output is not a json stream
+    """
+    import re
+    import json
+    text = output.decode()
+    decoder = json.JSONDecoder()
+    nonspace = re.compile(r'\S')
+    documents = list()  # type: List[CephOutput]
+    match = nonspace.search(text)
+    while match is not None:
+        try:
+            _, end = decoder.raw_decode(text, match.start())
+        except ValueError:
+            return list()
+        documents.append(text[match.start():end].encode())
+        match = nonspace.search(text, end)
+    return documents
+
+
+def get_health(jsondata: Any) -> Dict[str, Any]:
+    """
+    Get cluster health from ceph json output
+    :param jsondata: Ceph command json output
+    :return: Health, empty if output has no health
+    """
+    if not isinstance(jsondata, dict):
+        return dict()
+    health = jsondata.get('health', jsondata)
+    if not isinstance(health, dict):
+        return dict()
+    return health
 
 
-def compose_nagios_output(output, cliargs):
+def get_health_status(jsondata: Any) -> Optional[str]:
     """
-    Compose nagios message from ceph command output
+    Get cluster health status from ceph json output
+    :param jsondata: Ceph command json output
+    :return: Health status or None if output has no health status
+    """
+    return get_health(jsondata).get('status')
+
+
+def get_health_summary(jsondata: Any) -> str:
+    """
+    Get cluster health summary from ceph json output, as printed by ceph health
+    :param jsondata: Ceph command json output
+    :return: Health status followed by the message of each health check
+    """
+    health = get_health(jsondata)
+    summary = [health['status']]
+    checks = health.get('checks')
+    if isinstance(checks, dict):
+        messages = ('{0}'.format(check.get('summary', dict()).get('message', name)) for name, check in checks.items())
+        summary.append('; '.join(messages))
+    return ' '.join(summary).rstrip()
+
+
+def compose_nagios_output(output: CephOutput, cliargs: Any) -> Tuple[CephOutput, int]:
+    """
+    Compose nagios message from ceph command output. Json health is summarized as
+    ceph health does, other outputs are kept as bytes
     :param output: Ceph command result
     :param cliargs: Command line args
-    :return: Nagios code
+    :return: Nagios message and nagios code
     """
-    monid = getattr(cliargs, 'monid', None)
+    import re
+    import json
+    monid = vars(cliargs).get('monid')
     if monid is not None:
-        try:
-            jsondata = json.loads(output)
-        except ValueError:
-            if output.find('ObjectNotFound') != -1:
-                nagiosmessage = '{0} is not a valid ceph mon'.format(monid)
-                return nagiosmessage, STATUS_ERROR
-            else:
-                nagiosmessage = 'Unknown error'
-                return nagiosmessage, STATUS_UNKNOWN
-        healthstatus = jsondata['health']['status']
-        if healthstatus:
-            _, health = healthstatus.split('_')
-            nagiosmessage = healthstatus
-            nagioscode = STATUS_OK
-            if health == 'WARNING':
-                nagioscode = STATUS_WARNING
-            elif health == 'ERROR':
-                nagioscode = STATUS_ERROR
-            elif health == 'UNKNOWN':
-                nagioscode = STATUS_UNKNOWN
-        else:
-            nagiosmessage = 'No mons found'
-            nagioscode = STATUS_ERROR
-    else:
-        if output.find('HEALTH_OK') != -1:
-            nagiosmessage = output
-            nagioscode = STATUS_OK
-        elif output.find('HEALTH_WARN') != -1:
-            nagiosmessage = output
-            nagioscode = STATUS_WARNING
-        elif output.find('HEALTH_ERR') != -1:
-            nagiosmessage = output
-            nagioscode = STATUS_ERROR
+        # A mon ping only reports the health status, no need to parse it
+        statusmatch = re.search(HEALTH_STATUS_JSON_RE, output)
+        if statusmatch is not None:
+            healthstatus = statusmatch.group(1).decode()
+            return statusmatch.group(1), HEALTH_STATUS_CODES.get(healthstatus, STATUS_UNKNOWN)
+    try:
+        jsondata = json.loads(output)
+    except ValueError:
+        head = output[:HEALTH_STATUS_HEAD_SIZE].lstrip()
+        for prefix, code in HEALTH_STATUS_PREFIXES:
+            if head.startswith(prefix):
+                return output, code
+        match = re.search(HEALTH_STATUS_RE, output)
+        if match is None:
+            if monid is not None:
+                return b'Unknown error', STATUS_UNKNOWN
+            return b'OK: ' + output, STATUS_OK
+        if match.group(0) == b'ObjectNotFound':
+            if monid is not None:
+                return '{0} is not a valid ceph mon'.format(monid).encode(), STATUS_ERROR
+            return output, STATUS_ERROR
+        return output, HEALTH_STATUS_CODES[match.group(0).decode()]
+    healthstatus = get_health_status(jsondata)
+    if healthstatus:
+        return get_health_summary(jsondata).encode(), HEALTH_STATUS_CODES.get(healthstatus, STATUS_UNKNOWN)
+    if monid is not None:
+        return b'No mons found', STATUS_ERROR
+    return b'OK: ' + output, STATUS_OK
+
+
+def build_ceph_command(arguments: Any) -> Tuple[Optional[CephCommandBase], Optional[CephCommand]]:
+    """
+    Build ceph command from command line arguments
+    :param arguments: Command line arguments
+    :return: Ceph command object and ceph command. (None, None) if no valid command found
+    """
+    handler = getattr(arguments, 'handler', None)
+    if handler is None:
+        return None, None
+    ccmd = handler(arguments)
+    return ccmd, arguments.builder(ccmd)
+
+
+def _run_job(job: Tuple[CephCommandBase, List[CephCommand]]) -> Tuple[List[CephOutput], Optional[str]]:
+    """
+    Run the ceph commands of a ceph command object
+    :param job: Ceph command object and its ceph commands
+    :return: Ceph commands output and error message, None if the commands succeeded
+    """
+    ccmd, commands = job
+    try:
+        return ccmd.run_ceph_commands(commands), None
+    except CephCommandError as error:
+        return list(), str(error)
+
+
+def run_many(jobs: List[Tuple[CephCommandBase, List[CephCommand]]]) -> List[Tuple[List[CephOutput], Optional[str]]]:
+    """
+    Run the ceph commands of several ceph command objects, e.g. one per cluster, each in its own thread.
+    A failing job does not stop the others
+    :param jobs: Ceph command object and its ceph commands
+    :return: Ceph commands output and error message of each job
+    """
+    if len(jobs) == 1:
+        return [_run_job(jobs[0])]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        return list(executor.map(_run_job, jobs))
+
+
+def run_batch(parser: 'argparse.ArgumentParser', arguments: Any) -> int:
+    """
+    Run every check listed in the batch file with a single round of ceph commands
+    :param parser: Command line parser
+    :param arguments: Command line arguments
+    :return: Worst nagios status code
+    """
+    import json
+    import shlex
+    services = list()
+    try:
+        with open(arguments.batch) as batchfile:
+            for line in batchfile:
+                fields = shlex.split(line, comments=True)
+                if not fields:
+                    continue
+                serviceargs = parser.parse_args(fields[1:], namespace=type(arguments)(**vars(arguments)))
+                ccmd, cephcmd = build_ceph_command(serviceargs)
+                if ccmd is None:
+                    print('No valid command found for service {0}'.format(fields[0]))
+                    return STATUS_ERROR
+                if not cephcmd:
+                    print(ccmd.nagiosmessage, file=sys.stderr)
+                    return STATUS_ERROR
+                services.append((fields[0], serviceargs, ccmd, cephcmd))
+    except OSError as error:
+        print('ERROR: Unable to read batch file - {0}'.format(error))
+        return STATUS_ERROR
+    if not services:
+        print('No services found in batch file {0}'.format(arguments.batch))
+        return STATUS_ERROR
+    # Run the unique commands of the services sharing the global options at once,
+    # services with different global options (e.g. clusters) concurrently
+    jobs = dict()  # type: Dict[Tuple[Any, ...], Tuple[CephCommandBase, Dict[str, CephCommand]]]
+    for _, _, ccmd, cephcmd in services:
+        _, commands = jobs.setdefault(ccmd.globaloptions, (ccmd, dict()))
+        commands.setdefault(json.dumps(cephcmd, sort_keys=True), cephcmd)
+    results = dict()  # type: Dict[Tuple[Tuple[Any, ...], str], CephOutput]
+    errors = dict()  # type: Dict[Tuple[Any, ...], str]
+    joboutputs = run_many([(ccmd, list(commands.values())) for ccmd, commands in jobs.values()])
+    for (options, (_, commands)), (outputs, joberror) in zip(jobs.items(), joboutputs):
+        if joberror is not None:
+            errors[options] = joberror
+        results.update(zip(((options, key) for key in commands), outputs))
+    worstcode = STATUS_OK
+    for service, serviceargs, ccmd, cephcmd in services:
+        # Only the services of a failed job are critical
+        joberror = errors.get(ccmd.globaloptions)
+        result = results.get((ccmd.globaloptions, json.dumps(cephcmd, sort_keys=True)))
+        if joberror is not None:
+            nagiosmsg, nagioscode = joberror.encode(), STATUS_ERROR  # type: Tuple[CephOutput, int]
+        elif not result:
+            nagiosmsg, nagioscode = b'ERROR: Empty output from ceph command', STATUS_UNKNOWN
         else:
-            nagiosmessage = 'OK: {0}'.format(output)
-            nagioscode = STATUS_OK
-    return nagiosmessage, nagioscode
+            nagiosmsg, nagioscode = compose_nagios_output(result, serviceargs)
+        firstline = nagiosmsg.split(b'\n', 1)[0].decode(errors='replace')
+        print('{0}\t{1}\t{2}'.format(service, nagioscode, firstline))
+        worstcode = max(worstcode, nagioscode)
+    return worstcode
 
 
-def main():
+def main() -> int:
     """
     Main function
     :return: Nagios status code
     """
-    parser = _parse_arguments()
-    nargs = len(sys.argv[1:])
-    if not nargs:
-        parser.print_help()
-        return STATUS_ERROR
-    arguments = parser.parse_args()
-    if hasattr(arguments, 'status'):
-        # Common command
-        ccmd = CommonCephCommand(arguments)
-        cephcmd = ccmd.build_common_command()
-    elif hasattr(arguments, 'monstatus'):
-        # Mon command
-        ccmd = MonCephCommand(arguments)
-        cephcmd = ccmd.build_mon_command()
-    elif hasattr(arguments, 'stat'):
-        # Osd command
-        ccmd = OsdCephCommand(arguments)
-        cephcmd = ccmd.build_osd_command()
-    elif hasattr(arguments, 'mdsstat'):
-        # Mds command
-        ccmd = MdsCephCommand(arguments)
-        cephcmd = ccmd.build_mds_command()
-    else:
-        print('No valid command found')
-        return STATUS_ERROR
+    arguments = _parse_fast_arguments(sys.argv[1:])  # type: Any
+    if arguments is None:
+        parser = _parse_arguments()
+        nargs = len(sys.argv[1:])
+        if not nargs:
+            parser.print_help()
+            return STATUS_ERROR
+        arguments = parser.parse_args()
+        if arguments.batch is not None:
+            return run_batch(parser, arguments)
+        if getattr(arguments, 'handler', None) is None:
+            parser.print_help()
+            return STATUS_ERROR
+    # Both parsers only get here with a subcommand handler
+    ccmd = arguments.handler(arguments)  # type: CephCommandBase
+    cephcmd = arguments.builder(ccmd)  # type: Optional[CephCommand]
     if not cephcmd:
         print(ccmd.nagiosmessage, file=sys.stderr)
         return STATUS_ERROR
-    result = ccmd.run_ceph_command(cephcmd)
-    if result:
-        nagiosmsg, nagioscode = compose_nagios_output(result, arguments)
-        print(nagiosmsg)
+    if arguments.raw:
+        # Human readable ceph output, no need to keep python around to parse it
+        cephcmd['format'] = 'plain'
+        clicmd = ccmd.build_cli_command(cephcmd)
+        try:
+            os.execvp(clicmd[0], clicmd)
+        except OSError:
+            print('ERROR: Ceph executable not found - {0}'.format(clicmd[0]))
+            return STATUS_ERROR
+    # The check is classified from the json output, the details are read in the same round
+    commands = [cephcmd]
+    longcmd = LONG_OUTPUT_COMMANDS.get(cephcmd['prefix']) if cephcmd['format'] == 'json' else None
+    if longcmd is not None:
+        commands.append(dict(longcmd))
+    try:
+        results = ccmd.run_ceph_commands(commands)
+    except CephCommandError as error:
+        print(error)
+        return STATUS_ERROR
+    if not results[0]:
+        print('ERROR: Empty output from ceph command')
+        return STATUS_UNKNOWN
+    nagiosmsg, nagioscode = compose_nagios_output(results[0], arguments)
+    sys.stdout.buffer.writelines((nagiosmsg, b'\n'))
+    if longcmd is not None and results[1].strip():
+        sys.stdout.buffer.writelines((results[1].rstrip(), b'\n'))
     return nagioscode
 
 
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Distributed under GNU/GPL 2 license
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/
+
+
+"""
+Ceph nagios plugins helper daemon
+
+Keeps connections to the ceph cluster open, one per set of connection options,
+and runs the plugin commands received on a unix socket, using the ceph admin
+socket protocol.
+"""
+
+import os
+import sys
+import json
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+
+import rados
+
+try:
+    from . import _rados_backend
+except ImportError:
+    import _rados_backend
+
+# exit code
+STATUS_OK = 0
+STATUS_ERROR = 2
+
+# default ceph values
+CEPH_CONFIG = '/etc/ceph/ceph.conf'
+CEPH_HELPER_SOCKET = '/run/check_ceph_health.sock'
+CEPH_TIMEOUT = 10
+
+# command prefixes run by the plugin, any other command is refused
+ALLOWED_PREFIXES = ('status', 'health', 'quorum_status', 'df', 'ping', 'mon_status', 'mon stat', 'osd stat',
+                    'osd tree', 'mds stat')
+# longest command request accepted and seconds to wait for it
+REQUEST_MAX_SIZE = 4096
+REQUEST_TIMEOUT = 5
+
+# first file descriptor passed by systemd socket activation
+SD_LISTEN_FDS_START = 3
+
+__version__ = '0.5.1'
+
+
+class CephCommandHandler(socketserver.StreamRequestHandler):
+    """
+    Handler for a single ceph command request
+    """
+
+    def handle(self):
+        """
+        Read a NUL terminated json command and write the reply prefixed with its length.
+        Clients sending too much or too slowly are dropped
+        """
+        self.request.settimeout(REQUEST_TIMEOUT)
+        request = bytearray()
+        try:
+            while not request.endswith(b'\0'):
+                if len(request) > REQUEST_MAX_SIZE:
+                    return
+                chunk = self.request.recv(REQUEST_MAX_SIZE)
+                if not chunk:
+                    return
+                request.extend(chunk)
+        except socket.timeout:
+            return
+        try:
+            command = json.loads(request[:-1].decode())
+            reply = self.server.run_command(command)
+        except (ValueError, KeyError, TypeError) as error:
+            reply = 'ERROR: Invalid command - {0}'.format(error).encode()
+        self.wfile.write(struct.pack('>I', len(reply)) + reply)
+
+
+class CephHelperServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server sharing ceph cluster connections, one per set of connection options
+    """
+    daemon_threads = True
+
+    def __init__(self, address, cluster, connectionoptions, allowedconfs=(), allowedkeyrings=(), listenfd=None):
+        self._clusters = {connectionoptions: cluster}
+        self._connectionoptions = connectionoptions
+        conffile, _, _, _, keyring = connectionoptions
+        self._allowedconfs = frozenset(allowedconfs) | {conffile}
+        self._allowedkeyrings = frozenset(allowedkeyrings) | {keyring}
+        self._clusterslock = threading.Lock()
+        super(CephHelperServer, self).__init__(address, CephCommandHandler, bind_and_activate=listenfd is None)
+        if listenfd is not None:
+            self.socket.close()
+            self.socket = socket.socket(fileno=listenfd)
+
+    @property
+    def cluster(self):
+        """
+        Get ceph cluster connection of the command line options
+        :return: ceph cluster connection
+        """
+        return self._clusters[self._connectionoptions]
+
+    @property
+    def connectionoptions(self):
+        """
+        Get the options of the command line cluster connection, as sent by the plugin
+        :return: conf, mon address, client id, client name and keyring
+        """
+        return self._connectionoptions
+
+    def is_allowed(self, connectionoptions):
+        """
+        Check if a set of connection options is served. The conf file may set log files
+        and sockets written by the daemon, only the conf and keyring files given on the
+        daemon command line are read, never paths chosen by a socket client
+        :param connectionoptions: conf, mon address, client id, client name and keyring
+        :return: True if the conf and keyring files are allowed False otherwise
+        """
+        conffile, _, _, _, keyring = connectionoptions
+        return conffile in self._allowedconfs and keyring in self._allowedkeyrings
+
+    def get_cluster(self, connectionoptions):
+        """
+        Get the cluster connection for a set of connection options, connecting once
+        :param connectionoptions: conf, mon address, client id, client name and keyring
+        :return: ceph cluster connection or None if the options are not served
+        """
+        if not self.is_allowed(connectionoptions):
+            return None
+        with self._clusterslock:
+            cluster = self._clusters.get(connectionoptions)
+            if cluster is None:
+                cluster = _rados_backend.connect_cluster(connectionoptions, CEPH_TIMEOUT)
+                self._clusters[connectionoptions] = cluster
+        return cluster
+
+    def drop_cluster(self, connectionoptions):
+        """
+        Shutdown a failed cluster connection, unless it is the command line one
+        :param connectionoptions: conf, mon address, client id, client name and keyring
+        """
+        if connectionoptions == self._connectionoptions:
+            return
+        with self._clusterslock:
+            cluster = self._clusters.pop(connectionoptions, None)
+        if cluster is not None:
+            cluster.shutdown()
+
+    def shutdown_clusters(self):
+        """
+        Shutdown every cluster connection
+        """
+        with self._clusterslock:
+            for cluster in self._clusters.values():
+                cluster.shutdown()
+            self._clusters.clear()
+
+    def run_command(self, command):
+        """
+        Run ceph command on the cluster connection of its connection options
+        :param command: Ceph command, with the plugin connection options
+        :return: Ceph command output or an error message
+        """
+        if command['prefix'] not in ALLOWED_PREFIXES:
+            return 'ERROR: Command not allowed - {0}'.format(command['prefix']).encode()
+        connectionoptions = tuple(command.pop('connection', ()))
+        if len(connectionoptions) != 5 or not all(option is None or isinstance(option, str)
+                                                  for option in connectionoptions):
+            return b'ERROR: Invalid connection options'
+        try:
+            cluster = self.get_cluster(connectionoptions)
+            # A check for another cluster or client falls back to its own connection
+            if cluster is None:
+                return b'ERROR: Connection options not served by this helper'
+            ret, output, outs = _rados_backend.run_command(cluster, command, CEPH_TIMEOUT)
+        except rados.ObjectNotFound as error:
+            return 'ERROR: {0}'.format(error).encode()
+        except rados.Error as error:
+            self.drop_cluster(connectionoptions)
+            return 'ERROR: {0}'.format(error).encode()
+        # A lost or timed out mon session is not raised, only returned
+        if ret < 0:
+            self.drop_cluster(connectionoptions)
+        if ret != 0:
+            return 'ERROR: {0}'.format(outs).encode()
+        return output
+
+
+def _parse_arguments():
+    """
+    Parse command line arguments
+    :return: Command line arguments
+    """
+    parser = argparse.ArgumentParser(description='ceph nagios plugin helper daemon')
+    parser.add_argument('-c', '--conf', default=CEPH_CONFIG, help='alternative ceph conf file [{0}]'.format(CEPH_CONFIG))
+    parser.add_argument('-m', '--monaddress', help='ceph monitor address[:port]')
+    parser.add_argument('-i', '--user', dest='clientid', help='ceph client id')
+    parser.add_argument('-n', '--name', help='ceph client name')
+    parser.add_argument('-k', '--keyring', help='ceph client keyring file')
+    parser.add_argument('-C', '--allow-conf', action='append', default=list(), metavar='CONF',
+                        help='also serve checks using this ceph conf file, may be repeated')
+    parser.add_argument('-K', '--allow-keyring', action='append', default=list(), metavar='KEYRING',
+                        help='also serve checks using this keyring file, may be repeated')
+    parser.add_argument('-s', '--socket', default=CEPH_HELPER_SOCKET,
+                        help='unix socket to listen on, unused with systemd socket activation [{0}]'.format(
+                            CEPH_HELPER_SOCKET))
+    parser.add_argument('--version', action='version', version='%(prog)s {0}'.format(__version__))
+    return parser
+
+
+def main():
+    """
+    Main function
+    :return: Exit code
+    """
+    arguments = _parse_arguments().parse_args()
+    connectionoptions = (arguments.conf, arguments.monaddress, arguments.clientid, arguments.name, arguments.keyring)
+    try:
+        cluster = _rados_backend.connect_cluster(connectionoptions, CEPH_TIMEOUT)
+    except rados.Error as error:
+        print('ERROR: Unable to connect to ceph cluster - {0}'.format(error), file=sys.stderr)
+        return STATUS_ERROR
+    listenfd = None
+    if os.environ.get('LISTEN_PID') == str(os.getpid()) and int(os.environ.get('LISTEN_FDS', 0)) > 0:
+        listenfd = SD_LISTEN_FDS_START
+    elif os.path.exists(arguments.socket):
+        os.unlink(arguments.socket)
+    server = CephHelperServer(arguments.socket, cluster, connectionoptions, arguments.allow_conf,
+                              arguments.allow_keyring, listenfd)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if listenfd is None:
+            os.unlink(arguments.socket)
+        server.shutdown_clusters()
+    return STATUS_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+# Distributed under GNU/GPL 2 license
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see http://www.gnu.org/licenses/
+
+
+"""
+Tests for the ceph nagios plugin command line parsing and output classification
+"""
+
+import json
+import types
+
+import pytest
+
+from cephnagios import check_ceph_health
+from cephnagios.check_ceph_health import STATUS_ERROR, STATUS_OK, STATUS_UNKNOWN, STATUS_WARNING
+
+# command lines parsed by the getopt fast path, the result must match argparse
+FAST_ARGV = [
+    ['common', '--status'],
+    ['common', '--health'],
+    ['common', '--quorum'],
+    ['common', '--df'],
+    ['mon', '--monhealth', 'a'],
+    ['mon', '--monstatus'],
+    ['mon', '--monstat'],
+    ['osd', '--stat'],
+    ['osd', '--tree'],
+    ['mds', '--mdsstat'],
+    ['-c', '/etc/ceph/other.conf', 'common', '--health'],
+    ['--conf=/etc/ceph/other.conf', 'common', '--health'],
+    ['-e', '/opt/ceph', '-m', '10.0.0.1:6789', '-i', 'nagios', 'osd', '--stat'],
+    ['-n', 'client.nagios', '-k', '/etc/ceph/nagios.keyring', 'mon', '--monhealth', 'b'],
+    ['--name', 'client.nagios', '--keyring', '/etc/ceph/nagios.keyring', 'mds', '--mdsstat'],
+    ['-a', '', '-s', '', 'common', '--df'],
+    ['--asok', '/run/ceph/ceph-mon.a.asok', '--helper', '/tmp/helper.sock', 'common', '--quorum'],
+    ['-u', 'common', '--status'],
+    ['--use-cli', '-r', 'osd', '--tree'],
+    ['-ur', 'osd', '--tree'],
+    ['-c/etc/ceph/other.conf', 'common', '--health'],
+]
+
+# command lines left to argparse: help, version, batch mode, errors and unusual forms
+SLOW_ARGV = [
+    [],
+    ['-h'],
+    ['--version'],
+    ['-b', '/etc/nagios/ceph.batch'],
+    ['common'],
+    ['common', '--status', '--health'],
+    ['common', '--unknown'],
+    ['mon', '--monhealth'],
+    ['mon', '--monhealth', '-a'],
+    ['mon', '--monhealth=a'],
+    ['mon', '--monstatus', 'extra'],
+    ['unknown', '--status'],
+    ['--', 'common', '--status'],
+    ['-x', 'common', '--status'],
+]
+
+
+def namespace(**kwargs):
+    """
+    Build command line arguments
+    :return: Command line arguments
+    """
+    return types.SimpleNamespace(**kwargs)
+
+
+@pytest.mark.parametrize('argv', FAST_ARGV, ids=' '.join)
+def test_fast_arguments_match_argparse(argv):
+    fast = check_ceph_health._parse_fast_arguments(argv)
+    assert fast is not None
+    assert vars(fast) == vars(check_ceph_health._parse_arguments().parse_args(argv))
+
+
+@pytest.mark.parametrize('argv', SLOW_ARGV, ids=' '.join)
+def test_fast_arguments_fall_back_to_argparse(argv):
+    assert check_ceph_health._parse_fast_arguments(argv) is None
+
+
+HEALTH_WARN_JSON = json.dumps({
+    'status': 'HEALTH_WARN',
+    'checks': {
+        'OSD_DOWN': {'severity': 'HEALTH_WARN', 'summary': {'message': '1 osds down'}},
+        'PG_DEGRADED': {'severity': 'HEALTH_WARN', 'summary': {'message': 'Degraded data redundancy'}},
+    },
+}).encode()
+
+# ceph command output, command line arguments, expected nagios message and code
+COMPOSE_CASES = [
+    # json health, summarized as ceph health does
+    (HEALTH_WARN_JSON, namespace(), b'HEALTH_WARN 1 osds down; Degraded data redundancy', STATUS_WARNING),
+    (b'{"status": "HEALTH_OK", "checks": {}}', namespace(), b'HEALTH_OK', STATUS_OK),
+    (b'{"health": {"status": "HEALTH_ERR"}, "fsid": "x"}', namespace(), b'HEALTH_ERR', STATUS_ERROR),
+    (b'{"status": "HEALTH_UNKNOWN"}', namespace(), b'HEALTH_UNKNOWN', STATUS_UNKNOWN),
+    # json without health, e.g. quorum_status or mon_status
+    (b'{"quorum": [0, 1, 2]}', namespace(), b'OK: {"quorum": [0, 1, 2]}', STATUS_OK),
+    (b'{"quorum": [0, 1, 2]}', namespace(monid='a'), b'No mons found', STATUS_ERROR),
+    # mon ping, the health status read without parsing
+    (b'{"health": {"status": "HEALTH_OK"}}', namespace(monid='a'), b'HEALTH_OK', STATUS_OK),
+    (b'{"health": {"status": "HEALTH_WARN"}}', namespace(monid='a'), b'HEALTH_WARN', STATUS_WARNING),
+    (b'{"health": {"status": "HEALTH_ERR"}}', namespace(monid='a'), b'HEALTH_ERR', STATUS_ERROR),
+    # plain text starting with the health status
+    (b'HEALTH_OK\n', namespace(), b'HEALTH_OK\n', STATUS_OK),
+    (b'  HEALTH_WARN 1 osds down', namespace(), b'  HEALTH_WARN 1 osds down', STATUS_WARNING),
+    (b'HEALTH_ERR 1 mons down', namespace(), b'HEALTH_ERR 1 mons down', STATUS_ERROR),
+    # plain text with the health status further on
+    (b'  cluster:\n    health: HEALTH_WARN\n', namespace(), b'  cluster:\n    health: HEALTH_WARN\n', STATUS_WARNING),
+    # missing mon
+    (b'Error ENOENT: ObjectNotFound', namespace(monid='x'), b'x is not a valid ceph mon', STATUS_ERROR),
+    (b'Error ENOENT: ObjectNotFound', namespace(), b'Error ENOENT: ObjectNotFound', STATUS_ERROR),
+    # plain text without health status
+    (b'3 osds: 3 up, 3 in', namespace(), b'OK: 3 osds: 3 up, 3 in', STATUS_OK),
+    (bytearray(b'e1: 3 mons'), namespace(), b'OK: e1: 3 mons', STATUS_OK),
+    (b'no reply', namespace(monid='a'), b'Unknown error', STATUS_UNKNOWN),
+]
+
+
+@pytest.mark.parametrize('output, cliargs, message, code', COMPOSE_CASES)
+def test_compose_nagios_output(output, cliargs, message, code):
+    assert check_ceph_health.compose_nagios_output(output, cliargs) == (message, code)